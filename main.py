@@ -1,4 +1,5 @@
-import mmap, getopt, datetime, traceback, os, sys
+import mmap, getopt, datetime, traceback, os, sys, functools, struct, io, json, time, shutil, tempfile, contextlib, statistics
+from concurrent.futures import ProcessPoolExecutor
 
 DISKSIZE = 128*(2**20)
 BLOCKSIZE = 4*(2**10)
@@ -41,6 +42,16 @@ class iNode:
     e o tamanho máximo de arquivo a (1962*4096) = 8036352 bytes
     """
 
+    # posição de cada campo dentro do bloco do iNode
+    NAME = slice(0, 128)
+    TYPE = slice(128, 130)
+    CREATED = slice(130, 134)
+    MODIFIED = slice(134, 138)
+    OWNER = slice(138, 168)
+    TABLE = slice(168, BLOCKSIZE)
+    NULL = 65535
+    TABLEFORMAT = struct.Struct(f'>{(BLOCKSIZE - 168) // 2}H')
+
     def __init__(self, name, itype, created, modified, owner, table = []):
         self.name = name
         self.type = itype
@@ -96,20 +107,238 @@ class iNode:
         
         return serialized
     
+    @staticmethod
+    def decodeString(raw):
+        return raw.decode('utf-8').rstrip('\00')
+
+    @staticmethod
+    def decodeInt(raw):
+        return int.from_bytes(raw, 'big', signed=False)
+
+    @staticmethod
+    def decodeTable(raw):
+        return [block for block in iNode.TABLEFORMAT.unpack(raw) if block != iNode.NULL]
+
     @staticmethod
     def fromBytes(byteblock):
-        blocks = [int.from_bytes(byteblock[i:i+2], 'big', signed=False) for i in range(168, 4096, 2)]
         return iNode(
-            byteblock[0:128].decode('utf-8').rstrip('\00'),
-            int.from_bytes(byteblock[128:130], 'big', signed=False),
-            int.from_bytes(byteblock[130:134], 'big', signed=False),
-            int.from_bytes(byteblock[134:138], 'big', signed=False),
-            byteblock[138:168].decode('utf-8').rstrip('\00'),
-            [block for block in blocks if block != 65535]
+            iNode.decodeString(byteblock[iNode.NAME]),
+            iNode.decodeInt(byteblock[iNode.TYPE]),
+            iNode.decodeInt(byteblock[iNode.CREATED]),
+            iNode.decodeInt(byteblock[iNode.MODIFIED]),
+            iNode.decodeString(byteblock[iNode.OWNER]),
+            iNode.decodeTable(byteblock[iNode.TABLE])
         )
 
+class DirEntry:
+    """
+    entrada retornada por DiskManager.scandir
+    guarda apenas o índice do iNode, os campos são decodificados
+    direto do disco na primeira vez que forem acessados
+    """
+
+    def __init__(self, disk, inode):
+        self._disk = disk
+        self.inode = inode
+        self._start = inode * BLOCKSIZE
+
+    def __repr__(self) -> str:
+        return f"<DirEntry {self.name!r} inode={self.inode}>"
+
+    def _field(self, field):
+        return self._disk[self._start + field.start: self._start + field.stop]
+
+    @functools.cached_property
+    def name(self):
+        return iNode.decodeString(self._field(iNode.NAME))
+
+    @functools.cached_property
+    def type(self):
+        return iNode.decodeInt(self._field(iNode.TYPE))
+
+    @functools.cached_property
+    def created(self):
+        return iNode.decodeInt(self._field(iNode.CREATED))
+
+    @functools.cached_property
+    def modified(self):
+        return iNode.decodeInt(self._field(iNode.MODIFIED))
+
+    @functools.cached_property
+    def owner(self):
+        return iNode.decodeString(self._field(iNode.OWNER))
+
+    @functools.cached_property
+    def table(self):
+        return iNode.decodeTable(self._field(iNode.TABLE))
+
+    @functools.cached_property
+    def size(self):
+        # diretórios ocupam apenas o bloco do iNode
+        if self.type == 0:
+            return BLOCKSIZE
+
+        table = self.table
+        if not table:
+            return 0
+
+        # o último bloco do arquivo é preenchido com \x00 (ver _blockify)
+        last = table[-1] * BLOCKSIZE
+        return (len(table) - 1) * BLOCKSIZE + len(self._disk[last:last + BLOCKSIZE].rstrip(b'\x00'))
+
+    def is_dir(self):
+        return self.type == 0
+
+    def is_file(self):
+        return self.type == 1
+
+def _fsck_scan(diskpath, start, end, only_allocated=True):
+    # valida os cabeçalhos dos iNodes [start:end], executado em um processo do pool
+    # cada processo abre o próprio mmap (somente leitura) do disco
+    # só os iNodes marcados no bitmap são lidos, a menos que "only_allocated" seja falso
+    # retorna (índice, tipo, nome, tabela, erros) de cada iNode lido
+    results = []
+    with open(diskpath, 'rb') as d:
+        disk = mmap.mmap(d.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for idx in range(start, end):
+                if only_allocated and not disk[idx // 8] & (128 >> (idx % 8)):
+                    continue
+
+                block = disk[idx*BLOCKSIZE: (idx+1)*BLOCKSIZE]
+                errors = []
+
+                try:
+                    name = iNode.decodeString(block[iNode.NAME])
+                except UnicodeDecodeError:
+                    name = None
+                    errors.append('name is not valid utf-8')
+
+                try:
+                    iNode.decodeString(block[iNode.OWNER])
+                except UnicodeDecodeError:
+                    errors.append('owner is not valid utf-8')
+
+                itype = iNode.decodeInt(block[iNode.TYPE])
+                if itype not in (0, 1):
+                    errors.append(f'invalid type {itype}')
+
+                table = iNode.decodeTable(block[iNode.TABLE])
+
+                results.append((idx, itype, name, table, errors))
+        finally:
+            disk.close()
+
+    return results
+
+class FsckReport:
+    """
+    resultado de DiskManager.fsck
+    leaked -> blocos marcados no bitmap mas inalcançáveis a partir da raiz
+    orphans -> iNodes marcados no bitmap mas inalcançáveis a partir da raiz
+    lost -> topos das subárvores órfãs, religados em lost+found no reparo
+    unmarked -> blocos alcançáveis mas livres no bitmap
+    double -> (bloco, iNode) referências repetidas a um mesmo bloco
+    bad_pointers -> (iNode, bloco) ponteiros fora da região esperada
+    bad_headers -> (iNode, erro) iNodes alcançáveis com cabeçalho inválido
+    unsorted -> diretórios cuja tabela não está ordenada por nome
+    """
+
+    def __init__(self):
+        self.leaked = []
+        self.orphans = []
+        self.lost = []
+        self.unmarked = []
+        self.double = []
+        self.bad_pointers = []
+        self.bad_headers = []
+        self.unsorted = []
+        self.repaired = False
+
+    @property
+    def ok(self):
+        return not (
+            self.leaked or self.orphans or self.unmarked or self.double
+            or self.bad_pointers or self.bad_headers or self.unsorted
+        )
+
+    def print(self):
+        if self.ok:
+            print("fsck: no problems found")
+            return
+
+        for idx, error in self.bad_headers:
+            print(f"fsck: inode {idx}: {error}")
+        for idx, block in self.bad_pointers:
+            print(f"fsck: inode {idx}: pointer to block {block} out of range")
+        for block, idx in self.double:
+            print(f"fsck: inode {idx}: block {block} is already referenced")
+        for idx in self.unsorted:
+            print(f"fsck: inode {idx}: directory table is not sorted")
+
+        if self.orphans:
+            print(f"fsck: orphaned inodes: {' '.join(map(str, self.orphans))}")
+        for idx in self.lost:
+            print(f"fsck: inode {idx}: unlinked, {'relinked' if self.repaired else 'to be relinked'} as lost+found/inode{idx}")
+        if self.leaked:
+            print(f"fsck: leaked blocks{' (freed)' if self.repaired else ''}: {' '.join(map(str, self.leaked))}")
+        if self.unmarked:
+            print(f"fsck: unmarked blocks: {' '.join(map(str, self.unmarked))}")
+
+        print(f"fsck: {len(self.orphans)} orphaned inodes, {len(self.leaked)} leaked blocks, {len(self.unmarked)} unmarked blocks")
+
+        if self.repaired:
+            print("fsck: problems repaired")
+
+class TraceWriter:
+    """
+    grava os comandos executados em DiskManager.run em um arquivo de trace
+    uma linha JSON por registro, a primeira é o cabeçalho:
+        {"version": 1, "user": dono, "started": timestamp}
+    e cada comando em seguida:
+        {"t": segundos desde o início, "args": tokens, "dt": latência em segundos, "error": erro ou null}
+    """
+
+    def __init__(self, path, user):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.began = time.perf_counter()
+        self._write({'version': 1, 'user': user, 'started': int(datetime.datetime.now().timestamp())})
+
+    def _write(self, entry):
+        # cada linha é gravada imediatamente para o trace sobreviver a um crash
+        self.file.write(json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def record(self, args, start, elapsed, error):
+        self._write({'t': round(start - self.began, 6), 'args': args, 'dt': round(elapsed, 6), 'error': error})
+
+    def close(self):
+        self.file.close()
+
+def print_replay_report(results):
+    # exibe a latência por comando de um replay comparada com a gravada
+    by_command = {}
+    mismatches = 0
+    for (args, recorded, elapsed, recorded_error, error) in results:
+        by_command.setdefault(args[0], []).append((recorded, elapsed))
+        if (recorded_error is None) != (error is None):
+            mismatches += 1
+
+    print(f"{'command':<10} {'count':>6} {'recorded ms':>12} {'mean ms':>10} {'p50 ms':>10} {'max ms':>10}")
+    for command, samples in sorted(by_command.items()):
+        recorded = [r for (r, _) in samples]
+        elapsed = [e for (_, e) in samples]
+        print(
+            f"{command:<10} {len(samples):>6} {1000*statistics.mean(recorded):>12.3f} "
+            f"{1000*statistics.mean(elapsed):>10.3f} {1000*statistics.median(elapsed):>10.3f} {1000*max(elapsed):>10.3f}"
+        )
+
+    total = sum(e for (_, _, e, _, _) in results)
+    print(f"{len(results)} commands in {total:.3f}s, {mismatches} outcome mismatches")
+
 class DiskManager:
     INODESTART = 2 * BLOCKSIZE
+    INODEEND = 347 * 8
 
     """
     gerenciamento de blocos alocados:
@@ -124,7 +353,7 @@ class DiskManager:
     """
 
     def __init__(self, diskpath, user='system') -> None:
-        if not os.path.isfile('disk.bin'):
+        if not os.path.isfile(diskpath):
             bytearr = bytearray(DISKSIZE)
             bytearr[0:1] = int.to_bytes(224, 1, 'big', signed=False)
             bytearr[self.INODESTART: self.INODESTART + BLOCKSIZE] = (
@@ -139,11 +368,12 @@ class DiskManager:
                 disk.write(bytearr)
             
 
-        d = open(diskpath, 'r+b')
-        self.disk = mmap.mmap(d.fileno(), 0)
+        self._file = open(diskpath, 'r+b')
+        self.disk = mmap.mmap(self._file.fileno(), 0)
         self.user = user
         self.root = 2
         self.current_dir = [2]
+        self.diskpath = diskpath
 
     def _readBytes(self, start, end=None):
         # lê do disco os bytes no intervalo "start":"end"
@@ -366,24 +596,55 @@ class DiskManager:
             (parent_idx, _) = self._resolvePath(path)
 
         return (parent_idx, file_name)
-    def ls(self, where):
-        # lista os diretórios/arquivos do dir atual
-        node = self.get_inode(where)
+    def _scan(self, where):
+        # itera sobre as entradas de um diretório pelo índice do iNode
+        # a checagem de tipo é feita antes de criar o gerador, como em os.scandir
+        node = DirEntry(self.disk, where)
 
         if node.type != 0:
             raise FileNotFoundError(f'{node.name} is not a directory')
 
-        names = []
-        
-        for n in node.table:
-            i = self.get_inode(n)
+        return (DirEntry(self.disk, n) for n in node.table)
 
-            if i.type == 0:
-                names.append(f"{bcolors.OKBLUE}{i.name}{bcolors.ENDC}")
-            elif i.type == 1:
-                names.append(i.name)
-        
-        print(" ".join(names))
+    def scandir(self, path='.'):
+        # itera sobre as entradas (DirEntry) do diretório em "path"
+        return self._scan(self._resolvePath(path)[0])
+
+    def stat(self, path):
+        # retorna a entrada (DirEntry) do arquivo/diretório em "path"
+        return DirEntry(self.disk, self._resolvePath(path)[0])
+
+    @staticmethod
+    def _format_time(timestamp):
+        return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+    def ls(self, where, long=False):
+        # lista os diretórios/arquivos do dir atual
+        entries = self._scan(where)
+
+        if not long:
+            print(" ".join(
+                f"{bcolors.OKBLUE}{e.name}{bcolors.ENDC}" if e.type == 0 else e.name
+                for e in entries
+            ))
+            return
+
+        for e in entries:
+            kind = 'd' if e.type == 0 else '-'
+            name = f"{bcolors.OKBLUE}{e.name}{bcolors.ENDC}" if e.type == 0 else e.name
+            print(f"{kind} {e.inode:>5} {e.owner:<12} {e.size:>8} {self._format_time(e.modified)} {name}")
+
+    def print_stat(self, path):
+        # exibe os metadados de um arquivo/diretório
+        e = self.stat(path)
+
+        print(f"    File: {e.name}")
+        print(f"    Type: {'directory' if e.type == 0 else 'file'}")
+        print(f"   Inode: {e.inode}")
+        print(f"    Size: {e.size}")
+        print(f"   Owner: {e.owner}")
+        print(f" Created: {self._format_time(e.created)}")
+        print(f"Modified: {self._format_time(e.modified)}")
     
     def mvdir(self, origin, destiny):
         # move um diretório ou arquivo para dentro de outro diretorio
@@ -599,85 +860,414 @@ class DiskManager:
                 self.copy_file_blocks(src_inode, dest_inode)
                 self.set_inode(dest_parent.table[dest_parent_idx], dest_inode)
         
-    def run(self):
-        while True:
-            # get user input
-            curr_path = [self.get_inode(i).name for i in self.current_dir]
-            print(f"{bcolors.BOLD}{bcolors.OKGREEN}{self.user}{bcolors.ENDC}{bcolors.ENDC}@{bcolors.BOLD}{bcolors.OKBLUE}{'/'.join(curr_path)}{bcolors.ENDC}{bcolors.ENDC}$ ", end='', flush=True)
-
-            if self.current_dir:
-                curr_dir = self.current_dir[-1]
-            else:
-                curr_dir = self.root
-            
-            try:
-                usr_inp = input().split(" ")
-            except EOFError:
-                break
-            except KeyboardInterrupt:
-                print(" Bye!")
+    def fsck(self, repair=False, workers=None):
+        # verifica a consistência do disco a partir do iNode raiz
+        # os cabeçalhos dos iNodes são validados em paralelo por um pool de processos
+        self.disk.flush()
+        report = FsckReport()
+
+        workers = workers or os.cpu_count() or 1
+        step = -(-(self.INODEEND - self.root) // (workers * 4))
+        ranges = [(i, min(i + step, self.INODEEND)) for i in range(self.root, self.INODEEND, step)]
+
+        inodes = {}
+        if workers == 1:
+            for (start, end) in ranges:
+                for r in _fsck_scan(self.diskpath, start, end):
+                    inodes[r[0]] = r
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_fsck_scan, self.diskpath, start, end) for (start, end) in ranges]
+                for f in futures:
+                    for r in f.result():
+                        inodes[r[0]] = r
+
+        bitmap = self._readBytes(0, 2*BLOCKSIZE)
+        marked = lambda b: bitmap[b // 8] & (128 >> (b % 8))
+
+        def summary(idx):
+            # iNodes alcançáveis mas livres no bitmap não foram lidos pelo pool
+            if idx not in inodes:
+                inodes[idx] = _fsck_scan(self.diskpath, idx, idx + 1, only_allocated=False)[0]
+            return inodes[idx]
+
+        checked = set()
+
+        def check_header(idx):
+            # registra os erros de cabeçalho e o que deve ser reescrito no reparo
+            # o iNode nunca é desligado do diretório pai, só tem os campos ruins reescritos
+            if idx in checked:
                 return
-            
-            command = usr_inp[0]
+            checked.add(idx)
 
-            try:
-                if command == 'mkdir':
-                    self.mkdir(usr_inp[1])
+            (_, itype, name, table, errors) = summary(idx)
+            if idx == self.root and itype != 0:
+                errors = errors + ['root is not a directory']
+            if not errors:
+                return
 
-                elif command == 'rmdir':
-                    self.rmdir(curr_dir, usr_inp[1])
+            for error in errors:
+                report.bad_headers.append((idx, error))
+
+            if idx == self.root:
+                itype = 0
+            elif itype not in (0, 1):
+                # diretórios apontam para iNodes, arquivos para blocos de dados
+                itype = 0 if any(b < self.INODEEND for b in table) else 1
+            if name is None:
+                name = 'root' if idx == self.root else f'inode{idx}'
+
+            header_fixes[idx] = (itype, name, 'owner is not valid utf-8' in errors)
+            inodes[idx] = (idx, itype, name, table, errors)
+
+        # percorre a árvore a partir da raiz reconstruindo os blocos alcançáveis
+        reachable = {0, 1, self.root}
+        header_fixes = {}
+        dir_tables = {}
+        file_fixes = {}
+
+        def walk(stack):
+            while stack:
+                idx = stack.pop()
+                (_, itype, name, table, _) = inodes[idx]
+
+                if itype == 0:
+                    kept = []
+                    for block in table:
+                        if block < self.root or block >= self.INODEEND:
+                            report.bad_pointers.append((idx, block))
+                            continue
+                        if block in reachable:
+                            # entrada repetida, o iNode continua alcançável pela primeira
+                            report.double.append((block, idx))
+                            continue
+
+                        check_header(block)
+                        reachable.add(block)
+                        kept.append(block)
+                        stack.append(block)
+
+                    names = [inodes[b][2] for b in kept]
+                    if names != sorted(names):
+                        report.unsorted.append(idx)
+                        kept.sort(key=lambda b: inodes[b][2])
+
+                    if kept != table:
+                        dir_tables[idx] = kept
+                else:
+                    # ponteiros de arquivo nunca são removidos, isso deslocaria o conteúdo
+                    # no reparo cada ponteiro ruim recebe um bloco novo no mesmo lugar:
+                    # uma cópia do bloco já referenciado, ou um bloco zerado
+                    fixes = []
+                    for (pos, block) in enumerate(table):
+                        if block < self.INODEEND or block >= BLOCKNUMBER:
+                            report.bad_pointers.append((idx, block))
+                            fixes.append((pos, None))
+                        elif block in reachable:
+                            report.double.append((block, idx))
+                            fixes.append((pos, block))
+                        else:
+                            reachable.add(block)
+
+                    if fixes:
+                        file_fixes[idx] = fixes
+
+        check_header(self.root)
+        walk([self.root])
+
+        # iNodes alocados fora da árvore costumam ser subárvores que perderam o link
+        # (ex.: um crash no meio de mvdir), então cada uma é percorrida a partir do
+        # seu topo e religada em lost+found no reparo, em vez de ser liberada
+        report.orphans = sorted(i for i in inodes if marked(i) and i not in reachable)
+        for idx in report.orphans:
+            check_header(idx)
+
+        # iNodes sem nome e sem ponteiros (ex.: crash entre _allocate e set_inode,
+        # o bloco fica zerado) não têm nada a recuperar e são liberados no reparo
+        pending = [o for o in report.orphans if inodes[o][2] or any(inodes[o][3])]
+        while pending:
+            referenced = {b for o in pending if inodes[o][1] == 0 for b in inodes[o][3]}
+            # em um ciclo todos são referenciados, então o menor índice vira o topo
+            tops = [o for o in pending if o not in referenced] or pending[:1]
+
+            for idx in tops:
+                if idx in reachable:
+                    continue
+                reachable.add(idx)
+                report.lost.append(idx)
+                walk([idx])
+
+            pending = [o for o in pending if o not in reachable]
+
+        # compara o conjunto alcançável com o bitmap
+        for block in range(BLOCKNUMBER):
+            if marked(block) and block not in reachable:
+                report.leaked.append(block)
+            elif not marked(block) and block in reachable:
+                report.unmarked.append(block)
+
+        if repair and not report.ok:
+            def write_field(idx, field, raw):
+                self._writeBytes(idx*BLOCKSIZE + field.start, raw.ljust(field.stop - field.start, b'\x00'))
+
+            # os cabeçalhos primeiro, para que get_inode consiga decodificá-los
+            for idx, (itype, name, reset_owner) in header_fixes.items():
+                write_field(idx, iNode.TYPE, int.to_bytes(itype, 2, 'big', signed=False))
+                write_field(idx, iNode.NAME, name.encode('utf-8'))
+                if reset_owner:
+                    write_field(idx, iNode.OWNER, b'system')
+
+            for idx, table in dir_tables.items():
+                node = self.get_inode(idx)
+                node.table = table
+                self.set_inode(idx, node)
+
+            # reconstrói o bitmap inteiro a partir dos blocos alcançáveis
+            new_bitmap = bytearray(2*BLOCKSIZE)
+            for block in reachable:
+                new_bitmap[block // 8] |= (128 >> (block % 8))
+            self._writeBytes(0, new_bitmap)
+
+            # só depois do bitmap correto os blocos novos podem ser alocados
+            if report.lost:
+                self._relink_lost(report.lost)
+
+            for idx, fixes in file_fixes.items():
+                node = self.get_inode(idx)
+                for (pos, source) in fixes:
+                    try:
+                        new_block = self._allocate(type='data')
+                    except Exception:
+                        raise Exception(f"Not enough free space to repair inode {idx}")
 
-                elif command == 'mvdir':
-                    self.mvdir(usr_inp[1], usr_inp[2])
+                    if source is None:
+                        data = bytearray(BLOCKSIZE)
+                    else:
+                        data = self._readBytes(source*BLOCKSIZE, (source+1)*BLOCKSIZE)
+                    self._writeBytes(new_block*BLOCKSIZE, data)
+                    node.table[pos] = new_block
+                self.set_inode(idx, node)
 
-                elif command == 'cd':
-                    paths = self._resolvePath(usr_inp[1])
-                    self.current_dir = paths[1]
-                
-                elif command == 'mv':
-                    self.mv(usr_inp[1], usr_inp[2])
+            report.repaired = True
 
-                elif command == 'ls':
-                    self.ls(curr_dir)
+        return report
 
-                elif command == 'touch':
-                    self.touch(curr_dir, usr_inp[1])
+    def _relink_lost(self, lost):
+        # religa os iNodes em "lost" como lost+found/inode<N>, criando o diretório se preciso
+        root = self.get_inode(self.root)
+        (has, pos) = self._get_subdir(root.table, 'lost+found')
 
-                elif command == 'rm':
-                    self.rm(curr_dir, usr_inp[1])
-                
-                elif command == 'echo':
-                    try:
-                        data = " ".join(usr_inp[1:]).split('>>')[0].split("\"")
-                    except:
-                        raise Exception("Bad input")
+        if not has:
+            self.mkdir('/lost+found', [])
+            root = self.get_inode(self.root)
+            (has, pos) = self._get_subdir(root.table, 'lost+found')
 
-                    if len(data) != 3:
-                        raise Exception("Bad input")
+        found_idx = root.table[pos]
+        found = self.get_inode(found_idx)
 
-                    self.echo(usr_inp[-1], data[1])
+        if found.type != 0:
+            raise Exception('lost+found is not a directory')
+        if len(found.table) + len(lost) > 1962:
+            raise Exception('lost+found is full, it doesn\'t support more iNodes.')
 
-                elif command == 'cat':
-                    self.cat(usr_inp[1])
-                elif command == 'cp':
-                    self.cp(curr_dir, usr_inp[1], usr_inp[2])
-                else:
-                    pass
+        for idx in lost:
+            name = f'inode{idx}'
+            node = self.get_inode(idx)
+            node.name = name
+            self.set_inode(idx, node)
 
-            except Exception as e:
-                print(f'[{command}] {traceback.format_exc()}')
+            (has, pos) = self._get_subdir(found.table, name)
+            found.table.insert(pos, idx)
+
+        self.set_inode(found_idx, found)
+
+    def close(self):
+        self.disk.close()
+        self._file.close()
+
+    def execute(self, usr_inp):
+        # executa um comando já separado em tokens
+        if self.current_dir:
+            curr_dir = self.current_dir[-1]
+        else:
+            curr_dir = self.root
+
+        command = usr_inp[0]
+
+        if command == 'mkdir':
+            self.mkdir(usr_inp[1])
+
+        elif command == 'rmdir':
+            self.rmdir(curr_dir, usr_inp[1])
+
+        elif command == 'mvdir':
+            self.mvdir(usr_inp[1], usr_inp[2])
+
+        elif command == 'cd':
+            paths = self._resolvePath(usr_inp[1])
+            self.current_dir = paths[1]
+        
+        elif command == 'mv':
+            self.mv(usr_inp[1], usr_inp[2])
+
+        elif command == 'ls':
+            self.ls(curr_dir, long=len(usr_inp) > 1 and usr_inp[1] == '-l')
+
+        elif command == 'stat':
+            self.print_stat(usr_inp[1])
+
+        elif command == 'touch':
+            self.touch(curr_dir, usr_inp[1])
+
+        elif command == 'rm':
+            self.rm(curr_dir, usr_inp[1])
+        
+        elif command == 'echo':
+            try:
+                data = " ".join(usr_inp[1:]).split('>>')[0].split("\"")
+            except:
+                raise Exception("Bad input")
+
+            if len(data) != 3:
+                raise Exception("Bad input")
+
+            self.echo(usr_inp[-1], data[1])
+
+        elif command == 'cat':
+            self.cat(usr_inp[1])
+        elif command == 'cp':
+            self.cp(curr_dir, usr_inp[1], usr_inp[2])
+        elif command == 'fsck':
+            self.fsck(repair=len(usr_inp) > 1 and usr_inp[1] == '-r').print()
+        else:
+            pass
+
+    def _timed_execute(self, usr_inp):
+        # executa um comando medindo apenas o tempo de execute
+        # a saída vai para um buffer, para que gravação e replay meçam a mesma coisa
+        # retorna (latência, saída, erro, traceback)
+        output = io.StringIO()
+        error = None
+        tb = None
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(output):
+                self.execute(usr_inp)
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            error = f'{type(e).__name__}: {e}'
+            tb = traceback.format_exc()
+        else:
+            elapsed = time.perf_counter() - start
+
+        return (elapsed, output.getvalue(), error, tb)
+
+    def run(self, trace=None):
+        # se "trace" for passado, grava cada comando executado (ver TraceWriter)
+        recorder = TraceWriter(trace, self.user) if trace else None
+
+        try:
+            while True:
+                # get user input
+                curr_path = [self.get_inode(i).name for i in self.current_dir]
+                print(f"{bcolors.BOLD}{bcolors.OKGREEN}{self.user}{bcolors.ENDC}{bcolors.ENDC}@{bcolors.BOLD}{bcolors.OKBLUE}{'/'.join(curr_path)}{bcolors.ENDC}{bcolors.ENDC}$ ", end='', flush=True)
+
+                try:
+                    usr_inp = input().split(" ")
+                except EOFError:
+                    break
+                except KeyboardInterrupt:
+                    print(" Bye!")
+                    return
+
+                start = time.perf_counter()
+                (elapsed, output, error, tb) = self._timed_execute(usr_inp)
+
+                print(output, end='')
+                if tb:
+                    print(f'[{usr_inp[0]}] {tb}')
+
+                if recorder:
+                    recorder.record(usr_inp, start, elapsed, error)
+        finally:
+            if recorder:
+                recorder.close()
+
+    def replay(self, trace, paced=False):
+        # executa os comandos de um trace gravado por TraceWriter
+        # se "paced" for verdadeiro, respeita o intervalo original entre os comandos
+        # retorna uma lista de (args, latência gravada, latência, erro gravado, erro)
+        results = []
+
+        with open(trace, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            self.user = header['user']
+
+            began = time.perf_counter()
+            for line in f:
+                entry = json.loads(line)
+
+                if paced:
+                    delay = entry['t'] - (time.perf_counter() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                # a saída dos comandos é descartada
+                (elapsed, _, error, _) = self._timed_execute(entry['args'])
+
+                results.append((entry['args'], entry['dt'], elapsed, entry['error'], error))
+
+        return results
 
-            
 def main(argv):    
-    opts, args = getopt.getopt(argv, "h:u:")
+    opts, args = getopt.getopt(argv, "h:u:crt:p:i:s")
     
     user = 'system'
+    check = False
+    repair = False
+    trace = None
+    replay = None
+    image = None
+    paced = False
     for opt in opts:
         if opt[0] == '-u':
             user = opt[1]
+        elif opt[0] == '-c':
+            check = True
+        elif opt[0] == '-r':
+            check = True
+            repair = True
+        elif opt[0] == '-t':
+            trace = opt[1]
+        elif opt[0] == '-p':
+            replay = opt[1]
+        elif opt[0] == '-i':
+            image = opt[1]
+        elif opt[0] == '-s':
+            paced = True
+
+    if replay:
+        # o replay roda sobre uma cópia do snapshot (-i) ou sobre um disco novo
+        with tempfile.TemporaryDirectory() as tmp:
+            diskpath = os.path.join(tmp, 'disk.bin')
+            if image:
+                shutil.copyfile(image, diskpath)
+
+            A = DiskManager(diskpath)
+            try:
+                print_replay_report(A.replay(replay, paced=paced))
+            finally:
+                A.close()
+        return
 
     A = DiskManager('disk.bin', user=user)
-    A.run()
+
+    if check:
+        report = A.fsck(repair=repair)
+        report.print()
+        sys.exit(0 if report.ok or report.repaired else 1)
+
+    A.run(trace=trace)
 
 if __name__ == "__main__":
     main(sys.argv[1:])